@@ -27,32 +27,63 @@
  /_==__==========__==_ooo__ooo=_/'   /___________,"
 """
 import contextlib
+import functools
+import json
+import logging
 import os
+import sys
 from argparse import Namespace
 from subprocess import SubprocessError
 from typing import Optional, List, Type, Dict, Tuple, Any
 
 import yaml
-from git import GitCommandError
 
 from linktools import environ, utils
 from linktools.cli import BaseCommand, subcommand, SubCommandWrapper, subcommand_argument, SubCommandGroup, \
     BaseCommandGroup, SubCommand, CommandParser
 from linktools.cli.argparse import KeyValueAction, BooleanOptionalAction, ArgParseComplete
+from linktools.decorator import cached_property
 from linktools.rich import confirm, choose
 from linktools.types import ConfigError
 from .container import ContainerError, BaseContainer
 from .manager import ContainerManager
 
-manager = ContainerManager(environ)
+try:
+    from yaml import CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeDumper as _YamlDumper
 
+manager: ContainerManager = utils.lazy_load(ContainerManager, environ)
 
+
+def _output(logger: logging.Logger, data: Dict[str, Any], text: str = None) -> None:
+    # piped output is read by other tools, so emit one json document per line on stdout
+    if not sys.stdout.isatty():
+        print(json.dumps(data, ensure_ascii=False, default=str))
+    else:
+        logger.info(text if text is not None else yaml.dump(data, Dumper=_YamlDumper, sort_keys=False).strip())
+
+
+_PROXY_KEYS = frozenset((
+    "http_proxy", "https_proxy", "all_proxy", "no_proxy",
+    "HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "NO_PROXY",
+))
+
+
+def _iter_proxy_build_args():
+    for key, value in os.environ.items():
+        if key in _PROXY_KEYS:
+            yield from ("--build-arg", f"{key}={value}")
+
+
+@functools.lru_cache(maxsize=1)
 def _iter_container_names():
-    return [container.name for container in manager.containers.values()]
+    return tuple(container.name for container in manager.containers.values())
 
 
+@functools.lru_cache(maxsize=1)
 def _iter_installed_container_names():
-    return [container.name for container in manager.get_installed_containers()]
+    return tuple(container.name for container in manager.get_installed_containers())
 
 
 class RepoCommand(BaseCommandGroup):
@@ -68,10 +99,7 @@ class RepoCommand(BaseCommandGroup):
     def on_command_list(self):
         repos = manager.get_all_repos()
         for key, value in repos.items():
-            data = {key: value}
-            self.logger.info(
-                yaml.dump(data, sort_keys=False).strip()
-            )
+            _output(self.logger, {key: value})
 
     @subcommand("add", help="add repository")
     @subcommand_argument("url", help="repository url")
@@ -88,12 +116,12 @@ class RepoCommand(BaseCommandGroup):
     @subcommand("remove", help="remove repository")
     @subcommand_argument("url", nargs="?", help="repository url")
     def on_command_remove(self, url: str = None):
-        repos = list(manager.get_all_repos().keys())
+        repos = manager.get_all_repos()
         if not repos:
             raise ContainerError("No repository found")
 
         if url is None:
-            repo = choose("Choose repository you want to remove", repos)
+            repo = choose("Choose repository you want to remove", list(repos))
             if not confirm(f"Remove repository `{repo}`?", default=False):
                 raise ContainerError("Canceled")
             manager.remove_repo(repo)
@@ -146,15 +174,16 @@ class ConfigCommand(BaseCommand):
 
     @subcommand("list", help="list container configs")
     def on_command_list(self):
+        config = manager.config
         keys = set()
         for container in manager.prepare_installed_containers():
             keys.update(container.configs.keys())
-            if hasattr(container, "keys") and isinstance(container.keys, (Tuple, List, Dict)):
-                keys.update([key for key in container.keys if key in manager.config])
-        keys.update(manager.config.cache.keys())
+            if hasattr(container, "keys") and isinstance(container.keys, (tuple, list, dict)):
+                keys.update(key for key in container.keys if key in config)
+        keys.update(config.cache.keys())
         for key in sorted(keys):
-            value = manager.config.get(key)
-            self.logger.info(f"{key}: {value}")
+            value = config.get(key)
+            _output(self.logger, {key: value}, text=f"{key}: {value}")
 
     @subcommand("edit", help="edit the config file in an editor")
     @subcommand_argument("--editor", help="editor to use to edit the file")
@@ -164,7 +193,8 @@ class ConfigCommand(BaseCommand):
     @subcommand("reload", help="reload container configs")
     def on_command_reload(self):
         manager.config.reload()
-        manager.prepare_installed_containers()
+        manager.prepare_installed_containers(reload=True)
+        _iter_installed_container_names.cache_clear()
 
 
 class ExecCommand(BaseCommand):
@@ -176,17 +206,35 @@ class ExecCommand(BaseCommand):
     def name(self):
         return "exec"
 
-    @property
-    def _subparser(self) -> CommandParser:
+    @cached_property
+    def _subparsers(self) -> Dict[Tuple[Optional[str], Optional[str]], CommandParser]:
+        return dict()
+
+    def _get_subparser(self, exec_name: str = None, exec_subcommand: str = None) -> CommandParser:
+        key = exec_name, exec_subcommand
+        if key in self._subparsers:
+            return self._subparsers[key]
+
         parser = CommandParser()
 
         subcommands: List[SubCommand] = []
-        for container in manager.get_installed_containers():
+        if exec_name:
+            # exec_name has already been checked against the installed container choices
+            containers = [manager.containers[exec_name]]
+        else:
+            containers = manager.get_installed_containers()
+        for container in containers:
             subcommand_group = SubCommandGroup(container.name, container.description)
             subcommands.append(subcommand_group)
-            subcommands.extend(self.walk_subcommands(container, parent_id=subcommand_group.id))
+            container_subcommands = list(self.walk_subcommands(container, parent_id=subcommand_group.id))
+            if exec_subcommand:
+                # only the requested subcommand needs a parser, fall back to all of them for help/errors
+                container_subcommands = [o for o in container_subcommands if o.name == exec_subcommand] or \
+                                        container_subcommands
+            subcommands.extend(container_subcommands)
         self.add_subcommands(parser, target=subcommands)
 
+        self._subparsers[key] = parser
         return parser
 
     def init_arguments(self, parser: CommandParser) -> None:
@@ -196,16 +244,20 @@ class ExecCommand(BaseCommand):
 
         class Completer(ArgParseComplete.Completer):
 
+            exec_args = []
+
             def get_parser(_):
-                return self._subparser
+                return self._get_subparser(*_.exec_args[:2])
 
             def get_args(_, args, **kw):
-                return [args.exec_name, *args.exec_args] if args.exec_name else None
+                _.exec_args = [args.exec_name, *args.exec_args] if args.exec_name else []
+                return _.exec_args or None
 
         action.completer = Completer()
 
     def run(self, args: Namespace) -> Optional[int]:
-        args = self._subparser.parse_args([args.exec_name, *args.exec_args] if args.exec_name else [])
+        exec_args = [args.exec_name, *args.exec_args] if args.exec_name else []
+        args = self._get_subparser(*exec_args[:2]).parse_args(exec_args)
         subcommand = self.parse_subcommand(args)
         if not subcommand or isinstance(subcommand, SubCommandGroup):
             return self.print_subcommands(args, root=subcommand, max_level=2)
@@ -228,6 +280,8 @@ class Command(BaseCommandGroup):
 
     @property
     def known_errors(self) -> List[Type[BaseException]]:
+        from git import GitCommandError
+
         return super().known_errors + [
             ContainerError, ConfigError, SubprocessError, GitCommandError, OSError, AssertionError,
         ]
@@ -242,9 +296,9 @@ class Command(BaseCommandGroup):
 
     @subcommand("list", help="list all containers")
     def on_command_list(self):
-        install_containers = manager.get_installed_containers(resolve=False)
-        all_install_containers = manager.resolve_depend_containers(install_containers)
-        for container in sorted(manager.containers.values(), key=lambda o: o.order):
+        install_containers = set(manager.get_installed_containers(resolve=False))
+        all_install_containers = set(manager.resolve_depend_containers(install_containers))
+        for container in manager.sorted_containers:
             if container not in all_install_containers:
                 self.logger.info(f"[ ] {container.name}", extra={"style": "dim"})
             elif container in install_containers:
@@ -257,8 +311,9 @@ class Command(BaseCommandGroup):
                          choices=utils.lazy_iter(_iter_container_names))
     def on_command_add(self, names: List[str]):
         containers = manager.add_installed_containers(*names)
+        _iter_installed_container_names.cache_clear()
         assert containers, "No container added"
-        result = sorted(list([container.name for container in containers]))
+        result = sorted(container.name for container in containers)
         self.logger.info(f"Add {', '.join(result)} success")
 
     @subcommand("remove", help="remove containers from installed list")
@@ -267,27 +322,28 @@ class Command(BaseCommandGroup):
                          choices=utils.lazy_iter(_iter_container_names))
     def on_command_remove(self, names: List[str], force: bool = False):
         containers = manager.remove_installed_containers(*names, force=force)
+        _iter_installed_container_names.cache_clear()
         assert containers, "No container removed"
-        result = sorted(list([container.name for container in containers]))
+        result = sorted(container.name for container in containers)
         self.logger.info(f"Remove {', '.join(result)} success")
 
     @subcommand("info", help="display container info")
     @subcommand_argument("names", metavar="CONTAINER", nargs="+", help="container name",
                          choices=utils.lazy_iter(_iter_container_names))
     def on_command_info(self, names: List[str]):
+        containers = manager.containers
+        data = {}
         for name in names:
-            container = manager.containers[name]
-            data = {
-                name: {
-                    "path": container.root_path,
-                    "order": container.order,
-                    "enable": container.enable,
-                    "dependencies": container.dependencies,
-                    "configs": list(set(container.configs.keys())),
-                    "exposes": list(set([o.name for o in container.exposes])),
-                }
+            container = containers[name]
+            data[name] = {
+                "path": container.root_path,
+                "order": container.order,
+                "enable": container.enable,
+                "dependencies": container.dependencies,
+                "configs": list(container.configs.keys()),
+                "exposes": list(dict.fromkeys(o.name for o in container.exposes)),
             }
-            self.logger.info(yaml.dump(data, sort_keys=False).strip())
+        _output(self.logger, data)
 
     @subcommand("up", help="deploy installed containers")
     @subcommand_argument("--build", action=BooleanOptionalAction, help="build images before starting")
@@ -299,36 +355,12 @@ class Command(BaseCommandGroup):
         containers = manager.prepare_installed_containers()
         target_containers = [c for c in containers if c.name == name] if name else containers
 
-        build_options = []
-        up_options = ["--detach", "--no-build"]
-        if pull:
-            build_options.extend(["--pull"])
-            up_options.extend(["--pull", "always"])
-        if not name:
-            up_options.extend(["--remove-orphans"])
-
-        for key in ("http_proxy", "https_proxy", "all_proxy", "no_proxy"):
-            if key in os.environ:
-                build_options.extend(["--build-arg", f"{key}={os.environ[key]}"])
-            key = key.upper()
-            if key in os.environ:
-                build_options.extend(["--build-arg", f"{key}={os.environ[key]}"])
-
         services = []
         if name:
             services.extend(manager.containers[name].services.keys())
             assert services, f"No service found in container `{name}`"
 
-        with self._notify_start(target_containers):
-            if build:
-                manager.create_docker_compose_process(
-                    containers,
-                    "build", *build_options, *services,
-                ).check_call()
-            manager.create_docker_compose_process(
-                containers,
-                "up", *up_options, *services
-            ).check_call()
+        self._compose_up(containers, target_containers, services, build=build, pull=pull)
 
     @subcommand("restart", help="restart installed containers")
     @subcommand_argument("--build", action=BooleanOptionalAction, help="build images before starting")
@@ -340,14 +372,6 @@ class Command(BaseCommandGroup):
         containers = manager.prepare_installed_containers()
         target_containers = [c for c in containers if c.name == name] if name else containers
 
-        build_options = []
-        up_options = ["--detach", "--no-build"]
-        if pull:
-            build_options.extend(["--pull"])
-            up_options.extend(["--pull", "always"])
-        if not name:
-            up_options.extend(["--remove-orphans"])
-
         services = []
         if name:
             services.extend(manager.containers[name].services.keys())
@@ -359,16 +383,7 @@ class Command(BaseCommandGroup):
                 "stop", *services
             ).check_call()
 
-        with self._notify_start(target_containers):
-            if build:
-                manager.create_docker_compose_process(
-                    containers,
-                    "build", *build_options, *services,
-                ).check_call()
-            manager.create_docker_compose_process(
-                containers,
-                "up", *up_options, *services
-            ).check_call()
+        self._compose_up(containers, target_containers, services, build=build, pull=pull)
 
     @subcommand("down", help="stop installed containers")
     @subcommand_argument("name", metavar="CONTAINER", nargs="?", help="container name",
@@ -391,13 +406,40 @@ class Command(BaseCommandGroup):
         with self._notify_remove(target_containers):
             pass
 
+    def _compose_up(self, containers: List[BaseContainer], target_containers: List[BaseContainer],
+                    services: List[str], build: bool, pull: bool):
+        build_options = []
+        up_options = ["--detach"]
+        if pull:
+            build_options.extend(["--pull"])
+            up_options.extend(["--pull", "always"])
+        if not services:
+            up_options.extend(["--remove-orphans"])
+
+        build_options.extend(_iter_proxy_build_args())
+
+        # `up --build` has no equivalent of `build --pull/--build-arg`,
+        # so only fold the build into `up` when no build options are needed
+        standalone_build = build and build_options
+        up_options.append("--build" if build and not standalone_build else "--no-build")
+
+        with self._notify_start(target_containers):
+            if standalone_build:
+                manager.create_docker_compose_process(
+                    containers,
+                    "build", *build_options, *services,
+                ).check_call()
+            manager.create_docker_compose_process(
+                containers,
+                "up", *up_options, *services
+            ).check_call()
+
     @classmethod
     @contextlib.contextmanager
     def _notify_start(cls, containers: List[BaseContainer]):
         for container in containers:
-            if container.start_hooks:
-                for hook in container.start_hooks:
-                    hook()
+            for hook in container.start_hooks:
+                hook()
             container.on_starting()
 
         yield
@@ -415,9 +457,8 @@ class Command(BaseCommandGroup):
 
         for container in containers:
             container.on_stopped()
-            if container.stop_hooks:
-                for hook in container.stop_hooks:
-                    hook()
+            for hook in container.stop_hooks:
+                hook()
 
     @classmethod
     @contextlib.contextmanager
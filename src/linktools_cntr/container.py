@@ -46,6 +46,11 @@ if TYPE_CHECKING:
     from linktools.types import T, ConfigType
     from .manager import ContainerManager
 
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 
 class ExposeCategory:
 
@@ -248,7 +253,7 @@ class BaseContainer(ExposeMixin, NginxMixin, metaclass=AbstractMetaClass):
                 if not os.path.exists(path):
                     continue
                 data = self.render_template(path)
-                data = yaml.safe_load(data)
+                data = yaml.load(data, Loader=_YamlLoader)
                 if "services" in data and isinstance(data["services"], dict):
                     for name, service in data["services"].items():
                         if not isinstance(service, dict):
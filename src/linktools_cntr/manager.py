@@ -32,13 +32,12 @@ import os
 import os.path
 import pathlib
 import shutil
-from typing import TYPE_CHECKING, Dict, Any, List, Union, Callable, Tuple, Set
+from typing import TYPE_CHECKING, Dict, Any, List, Union, Callable, Tuple, Set, Optional
 
 from linktools import utils, Config
 from linktools.decorator import cached_property
 from linktools.types import PathType, FileCache
 from .container import BaseContainer, SimpleContainer, ContainerError
-from .repository import Repository
 
 if TYPE_CHECKING:
     from linktools import BaseEnviron
@@ -71,6 +70,7 @@ class ContainerManager:
         self.docker_compose_names = ("compose.yaml", "compose.yml", "docker-compose.yaml", "docker-compose.yml")
 
         self._setting_cache = {}
+        self._prepared_containers: Optional[List[BaseContainer]] = None
 
     @property
     def debug(self) -> bool:
@@ -225,6 +225,15 @@ class ContainerManager:
                 self.logger.warning(f"Not found installed container `{name}`, skip.")
         return result
 
+    @cached_property
+    def sorted_containers(self) -> List[BaseContainer]:
+        return sorted(self.containers.values(), key=lambda o: o.order)
+
+    def _clear_containers(self):
+        self.__dict__.pop("containers", None)
+        self.__dict__.pop("sorted_containers", None)
+        self._prepared_containers = None
+
     def _load_containers(self) -> List[BaseContainer]:
         containers: List[BaseContainer] = []
 
@@ -306,7 +315,9 @@ class ContainerManager:
                     result[depend_container] = functools.partial(lambda o: order(result[o]) - 1, container)
         return sorted(result, key=lambda o: (order(result[o]), o.order, o.name))
 
-    def prepare_installed_containers(self) -> List[BaseContainer]:
+    def prepare_installed_containers(self, reload: bool = False) -> List[BaseContainer]:
+        if not reload and self._prepared_containers is not None:
+            return self._prepared_containers
         self.logger.debug(f"Load container type: {self.container_type}")  # 加载容器类型
         containers = self.get_installed_containers(resolve=True)
         if not containers:
@@ -322,6 +333,7 @@ class ContainerManager:
                 self.logger.debug(f"Generate Dockerfile for {container.name}")
             if container.docker_compose and self.debug:  # 加载每个容器的docker-compose.yml
                 self.logger.debug(f"Generate docker-compose.yml for {container.name}")
+        self._prepared_containers = containers
         return containers
 
     def add_installed_containers(self, *names: str) -> List[BaseContainer]:
@@ -376,6 +388,7 @@ class ContainerManager:
         return list(result)
 
     def _dump_installed_containers(self, containers: List[BaseContainer]) -> None:
+        self._prepared_containers = None
         self._dump_setting("INSTALLED_CONTAINERS", list(set([container.name for container in containers])))
 
     def create_process(
@@ -449,6 +462,8 @@ class ContainerManager:
         return self._load_setting("INSTALLED_REPOS", default={})
 
     def add_repo(self, url: str, branch: str = None, force: bool = False):
+        from .repository import Repository
+
         with self._settings.lock("repo"):
             repos = self._load_setting("INSTALLED_REPOS", reload=True, default={})
 
@@ -482,8 +497,11 @@ class ContainerManager:
                 repos[path] = dict(type="local", repo_path=repo_path, repo_name=repo_name)
 
             self._dump_setting("INSTALLED_REPOS", repos)
+            self._clear_containers()
 
     def update_repos(self, force: bool = False):
+        from .repository import Repository
+
         for url, meta in self.get_all_repos().items():
             repo_type = meta.get("type", None)
             repo_path = meta.get("repo_path", None)
@@ -499,6 +517,7 @@ class ContainerManager:
                     self.logger.warning(f"Repository `{repo_path}` is dirty, reset to HEAD")
                     repo.git.reset(hard=True)
                 repo.update_with_progress()
+        self._clear_containers()
 
     def remove_repo(self, url: str):
         with self._settings.lock("repo"):
@@ -507,6 +526,7 @@ class ContainerManager:
                 raise ContainerError(f"Repository `{url}` not found.")
             self._remove_repo_file(repos.pop(url))
             self._dump_setting("INSTALLED_REPOS", repos)
+            self._clear_containers()
 
     def _choose_repo_path(self, name: str):
         index = 0